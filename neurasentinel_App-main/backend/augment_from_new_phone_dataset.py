@@ -1,19 +1,21 @@
 from __future__ import annotations
 
+import os
+import re
 from pathlib import Path
-
-import numpy as np
-import pandas as pd
+from typing import Dict
 
 from prepare_phone_dataset import (
     FS_TARGET,
     PRE_SEG_SEC,
     POST_SEG_SEC,
     SEGMENT_SAMPLES,
+    acceleration_magnitude,
     build_common_six_axis,
     smooth_and_detect_peaks,
     segment_around_peaks,
     to_fixed_length,
+    write_segment_csv,
 )
 
 
@@ -27,6 +29,9 @@ CLASS_MAP = {
     "backhand1": "Backhand",
 }
 
+# Next free index per class, so repeated folders for one class scan its directory once
+_NEXT_INDEX: Dict[str, int] = {}
+
 
 def find_accel_and_gyro_files(folder: Path):
     """Return (accelerometer_csv, gyro_csv) for a given folder, if present."""
@@ -42,22 +47,22 @@ def find_accel_and_gyro_files(folder: Path):
 
 def next_index_for_class(class_name: str) -> int:
     """Find the next available index for class_name_XXX.csv in OUT_ROOT/class_name."""
+    cached = _NEXT_INDEX.get(class_name)
+    if cached is not None:
+        return cached
+
     class_dir = OUT_ROOT / class_name
     class_dir.mkdir(parents=True, exist_ok=True)
 
-    max_idx = 0
-    for csv_path in class_dir.glob(f"{class_name}_*.csv"):
-        stem = csv_path.stem
-        parts = stem.split("_")
-        if len(parts) != 2:
-            continue
-        try:
-            idx = int(parts[1])
-        except ValueError:
-            continue
-        if idx > max_idx:
-            max_idx = idx
+    # os.scandir yields names without a stat() per entry, unlike Path.glob
+    pattern = re.compile(rf"^{re.escape(class_name)}_(\d+)\.csv$")
+    with os.scandir(class_dir) as entries:
+        max_idx = max(
+            (int(m.group(1)) for entry in entries if (m := pattern.match(entry.name))),
+            default=0,
+        )
 
+    _NEXT_INDEX[class_name] = max_idx + 1
     return max_idx + 1
 
 
@@ -71,8 +76,7 @@ def process_new_folder(folder: Path, label: str) -> int:
     t_grid, data6 = build_common_six_axis(accel_path, gyro_path, FS_TARGET)
 
     # Use acceleration magnitude to detect swing peaks
-    acc = data6[:, :3]
-    mag = np.linalg.norm(acc, axis=1)
+    mag = acceleration_magnitude(data6)
 
     peaks = smooth_and_detect_peaks(mag, FS_TARGET, thresh_factor=1.0, min_distance_sec=0.3)
     if not peaks:
@@ -88,14 +92,11 @@ def process_new_folder(folder: Path, label: str) -> int:
     count = 0
     for seg in segments:
         fixed = to_fixed_length(seg, SEGMENT_SAMPLES)
-        df_out = pd.DataFrame(
-            fixed,
-            columns=["acc_x", "acc_y", "acc_z", "gyro_x", "gyro_y", "gyro_z"],
-        )
         out_path = class_dir / f"{label}_{next_idx:03d}.csv"
-        df_out.to_csv(out_path, index=False)
+        write_segment_csv(out_path, fixed)
         next_idx += 1
         count += 1
+    _NEXT_INDEX[label] = next_idx
 
     print(f"[INFO] Wrote {count} new segments for {label} to {class_dir}")
     return count
@@ -12,9 +12,10 @@ It is intentionally simple and transparent so examiners can audit the
 behaviour without needing to inspect the ML internals.
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 
 import numpy as np
+from numba import njit
 
 
 SHOT_CORRECTIONS: Dict[str, Dict[str, str]] = {
@@ -59,6 +60,67 @@ SHOT_CORRECTIONS: Dict[str, Dict[str, str]] = {
     },
 }
 
+# Flattened (selected, predicted) -> message view of SHOT_CORRECTIONS for one-step lookups
+_SHOT_CORRECTIONS_FLAT: Dict[Tuple[str, str], str] = {
+    (selected, predicted): msg
+    for selected, per_predicted in SHOT_CORRECTIONS.items()
+    for predicted, msg in per_predicted.items()
+}
+
+_DEFAULT_WRONG_MSG = (
+    "Your motion does not fully match the selected shot. "
+    "Review the tutorial and focus on racket angle and swing path."
+)
+_LOW_PACE_HINT = " Swing speed is quite low – drive more from legs and hips."
+_HIGH_PACE_HINT = " Pace is high – make sure you stay balanced and in control."
+
+# Labels emitted by the classifier (the same eight shots as ml_model.CLASS_NAMES);
+# these never need whitespace normalisation
+_KNOWN_SHOTS = frozenset(SHOT_CORRECTIONS)
+
+_SWING_PLANE_SHOTS = frozenset({"Forehand", "Backhand"})
+_WRIST_SHOTS = frozenset({"Forehand", "Flick", "Backhand"})
+
+
+@njit(cache=True, fastmath=True, nogil=True)
+def _extract_features_nb(arr: np.ndarray) -> Tuple[float, float, float, float, float]:
+    """Single pass over a (T, >=6) window.
+
+    Returns (speed, mean_ax, mean_az, mean_gz, follow_through), replacing six
+    separate NumPy reductions over the same window.
+    """
+
+    n = arr.shape[0]
+    tail_start = int(0.6 * n)
+    sum_ax = 0.0
+    sum_az = 0.0
+    sum_gz = 0.0
+    max_mag_sq = 0.0
+    sum_tail = 0.0
+    for i in range(n):
+        ax = arr[i, 0]
+        ay = arr[i, 1]
+        az = arr[i, 2]
+        mag_sq = ax * ax + ay * ay + az * az
+        if mag_sq > max_mag_sq:
+            max_mag_sq = mag_sq
+        # Only the follow-through tail needs per-sample magnitudes
+        if i >= tail_start:
+            sum_tail += np.sqrt(mag_sq)
+        sum_ax += ax
+        sum_az += az
+        sum_gz += arr[i, 5]
+
+    # Follow-through: average magnitude over last ~30% of samples
+    follow_through = sum_tail / (n - tail_start) if n >= 10 else 0.0
+    return np.sqrt(max_mag_sq), sum_ax / n, sum_az / n, sum_gz / n, follow_through
+
+
+# Compile (or load from the on-disk cache) at import, not on the first request.
+# Requests arrive as float32; float64 stays supported for offline callers.
+_extract_features_nb(np.zeros((1, 6), dtype=np.float32))
+_extract_features_nb(np.zeros((1, 6), dtype=np.float64))
+
 
 def extract_motion_features_from_array(sensor_array: np.ndarray) -> Dict[str, float]:
     """Extract simple biomechanical features from a (T, 6) IMU window.
@@ -70,40 +132,28 @@ def extract_motion_features_from_array(sensor_array: np.ndarray) -> Dict[str, fl
     if sensor_array.size == 0:
         return {}
 
-    arr = np.asarray(sensor_array, dtype=float)
+    arr = np.asarray(sensor_array)
+    if arr.dtype != np.float32 and arr.dtype != np.float64:
+        arr = arr.astype(np.float32)
     if arr.ndim != 2 or arr.shape[1] < 6:
         return {}
 
-    acc = arr[:, :3]
-    gyro = arr[:, 3:6]
-
-    mag = np.linalg.norm(acc, axis=1)
-    speed = float(np.max(mag))
+    speed, mean_ax, mean_az, mean_gz, follow_through = _extract_features_nb(arr)
 
-    avg_acc = np.mean(acc, axis=0)
-    avg_gyro = np.mean(gyro, axis=0)
-
-    horizontal_power = float(abs(avg_acc[0]))  # approx forward component
-    vertical_power = float(avg_acc[2])
+    horizontal_power = float(abs(mean_ax))  # approx forward component
+    vertical_power = float(mean_az)
     upward_power = float(max(0.0, vertical_power))
     downward_power = float(max(0.0, -vertical_power))
 
-    wrist_rotation = float(abs(avg_gyro[2]))  # z-axis rotation as wrist proxy
-
-    # Follow-through: average magnitude over last ~30% of samples
-    if mag.size >= 10:
-        start_idx = int(0.6 * mag.size)
-        follow_through = float(np.mean(mag[start_idx:]))
-    else:
-        follow_through = 0.0
+    wrist_rotation = float(abs(mean_gz))  # z-axis rotation as wrist proxy
 
     return {
-        "speed": speed,
+        "speed": float(speed),
         "horizontal_power": horizontal_power,
         "upward_power": upward_power,
         "downward_power": downward_power,
         "wrist_rotation": wrist_rotation,
-        "follow_through": follow_through,
+        "follow_through": float(follow_through),
     }
 
 
@@ -119,14 +169,14 @@ def advanced_coaching(selected_shot: str, motion: Dict[str, float]) -> str:
         msg.append("Good power – strong acceleration through the stroke.")
 
     # --- SWING PLANE ---
-    if selected_shot in ["Forehand", "Backhand"]:
+    if selected_shot in _SWING_PLANE_SHOTS:
         if motion["downward_power"] > motion["upward_power"]:
             msg.append("Your stroke is too downward. Lift your swing slightly upward.")
         if motion["horizontal_power"] < 6.0:
             msg.append("Insufficient forward motion – extend your arm more forward.")
 
     # --- WRIST ROTATION ---
-    if selected_shot in ["Forehand", "Flick", "Backhand"]:
+    if selected_shot in _WRIST_SHOTS:
         if motion["wrist_rotation"] < 8.0:
             msg.append("Increase your wrist rotation for better spin and control.")
 
@@ -159,11 +209,19 @@ def get_coaching(
     """
 
     # Normalise labels
-    predicted = (predicted_shot or "").strip()
-    selected = (selected_shot or predicted).strip()
+    predicted = predicted_shot if predicted_shot in _KNOWN_SHOTS else (predicted_shot or "").strip()
+    if selected_shot in _KNOWN_SHOTS:
+        selected = selected_shot
+    else:
+        selected = (selected_shot or predicted).strip()
 
-    # Base score from confidence
-    technique_score = int(round(max(0.0, min(confidence, 1.0)) * 100))
+    # Base score from confidence (written so NaN maps to 0)
+    if not confidence > 0.0:
+        technique_score = 0
+    elif confidence >= 1.0:
+        technique_score = 100
+    else:
+        technique_score = round(confidence * 100)
 
     # High-level correctness / mapping message
     if predicted == selected and confidence >= 0.85:
@@ -174,21 +232,15 @@ def get_coaching(
             "Focus on clean contact and full follow-through."
         )
     else:
-        wrong_map = SHOT_CORRECTIONS.get(selected, {})
-        wrong_msg = wrong_map.get(
-            predicted,
-            "Your motion does not fully match the selected shot. Review the tutorial and focus on racket angle and swing path.",
-        )
+        wrong_msg = _SHOT_CORRECTIONS_FLAT.get((selected, predicted), _DEFAULT_WRONG_MSG)
 
         # Pace hint for wrong shots
         if speed < 8.0:
-            pace_hint = " Swing speed is quite low – drive more from legs and hips."
+            message = wrong_msg + _LOW_PACE_HINT
         elif speed > 22.0:
-            pace_hint = " Pace is high – make sure you stay balanced and in control."
+            message = wrong_msg + _HIGH_PACE_HINT
         else:
-            pace_hint = ""
-
-        message = wrong_msg + pace_hint
+            message = wrong_msg
 
     # Append advanced biomechanical feedback if available
     if motion_features:
@@ -1,13 +1,20 @@
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
 
+import base64
+import binascii
+import itertools
 import json
+import math
+import threading
+from operator import itemgetter
 from pathlib import Path
 
 import numpy as np
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
+from typing_extensions import TypedDict
 
 from ml_model import get_classifier
 from coaching import get_coaching, extract_motion_features_from_array
@@ -26,7 +33,10 @@ app.add_middleware(
 )
 
 
-class SwingSample(BaseModel):
+# A TypedDict rather than a BaseModel: pydantic-core validates it entirely in Rust
+# and yields plain dicts, instead of building one model instance per sample.
+# The JSON shape of a sample is unchanged.
+class SwingSample(TypedDict):
     ax: float
     ay: float
     az: float
@@ -40,11 +50,20 @@ class SwingRequest(BaseModel):
     player_id: str
     session_id: Optional[str] = None
     sampling_rate_hz: float
-    samples: List[SwingSample]
+    samples: Optional[List[SwingSample]] = None
+    # Alternative to `samples`: base64-encoded little-endian float32 rows of
+    # [ax, ay, az, gx, gy, gz, t]. Exactly one of the two must be sent.
+    samples_b64: Optional[str] = None
     source: Optional[str] = None
     # Optional: which shot the player is intending to practice (e.g. "Forehand")
     target_shot: Optional[str] = None
 
+    @model_validator(mode="after")
+    def _one_sample_format(self) -> "SwingRequest":
+        if (self.samples is None) == (self.samples_b64 is None):
+            raise ValueError("Send exactly one of `samples` or `samples_b64`.")
+        return self
+
 
 class ClassificationResult(BaseModel):
     shot_type: str
@@ -121,51 +140,198 @@ class _ShotAccumulator:
     count: int = 0
     sum_confidence: float = 0.0
     sum_speed_mps: float = 0.0
+    # Running averages kept in step with the sums so GET endpoints never divide
+    average_confidence: float = field(default=0.0, init=False)
+    average_speed_mps: float = field(default=0.0, init=False)
+
+    def __post_init__(self) -> None:
+        if self.count > 0:
+            self.average_confidence = self.sum_confidence / self.count
+            self.average_speed_mps = self.sum_speed_mps / self.count
+
+    def add(self, confidence: float, speed_mps: float) -> None:
+        self.count += 1
+        self.sum_confidence += confidence
+        self.sum_speed_mps += speed_mps
+        self.average_confidence = self.sum_confidence / self.count
+        self.average_speed_mps = self.sum_speed_mps / self.count
 
 
 _SESSION_STATS: dict = {}
 
+# Secondary index player_id -> {session_id, ...} over the keys of _SESSION_STATS
+_SESSIONS_BY_PLAYER: dict = {}
+
 _STATS_FILE = Path(__file__).resolve().parent / "data" / "session_stats.json"
+# Append-only log of swings recorded since the last full snapshot in _STATS_FILE.
+# Each line is [player_id, session_id, shot_type, confidence, speed_mps].
+_JOURNAL_FILE = _STATS_FILE.with_suffix(".jsonl")
+# A snapshot rotates the journal aside as session_stats.jsonl.<seq> and records
+# the highest <seq> it covers under _SNAPSHOT_SEQ_KEY. Rotated journals the
+# snapshot does not cover yet (an interrupted write) are replayed on load.
+_SNAPSHOT_SEQ_KEY = "_journal_seq"
+
+# Fold the journal back into the snapshot after this many swings
+_COMPACT_EVERY = 1024
 
 _LAST_SWING_RESULT: dict = {}
 
+_journal_handle = None
+_journal_records = 0
+# Sequence number of the most recently rotated journal
+_journal_seq = 0
+# Set once a compaction has been handed to the caller, until _save_session_stats runs
+_compaction_scheduled = False
+
+# Snapshots are written from a background thread; this keeps them consistent with
+# the in-memory stats and journal that the request handlers update.
+_STATS_LOCK = threading.RLock()
+# Serializes whole snapshots, so an older one can never replace a newer one
+_SNAPSHOT_LOCK = threading.Lock()
+
+
+def _rotated_journals() -> List[Tuple[int, Path]]:
+    """(seq, path) of every rotated journal on disk, oldest first."""
+    found = []
+    for path in _JOURNAL_FILE.parent.glob(_JOURNAL_FILE.name + ".*"):
+        seq = path.suffix[1:]
+        if seq.isdigit():
+            found.append((int(seq), path))
+    return sorted(found)
+
 
 def _load_session_stats() -> None:
-    global _SESSION_STATS
-    if not _STATS_FILE.exists():
-        return
-    data = json.loads(_STATS_FILE.read_text(encoding="utf-8"))
+    global _SESSION_STATS, _SESSIONS_BY_PLAYER, _journal_records, _journal_seq
     restored: dict = {}
-    for key_str, per_shot in data.items():
-        player_id, session_id_raw = key_str.split("|", 1)
-        session_id_val = session_id_raw or None
-        inner: dict = {}
-        for shot_type, acc_dict in per_shot.items():
-            inner[shot_type] = _ShotAccumulator(
-                count=int(acc_dict.get("count", 0)),
-                sum_confidence=float(acc_dict.get("sum_confidence", 0.0)),
-                sum_speed_mps=float(acc_dict.get("sum_speed_mps", 0.0)),
-            )
-        restored[(player_id, session_id_val)] = inner
+    covered_seq = 0
+    if _STATS_FILE.exists():
+        data = json.loads(_STATS_FILE.read_text(encoding="utf-8"))
+        covered_seq = int(data.pop(_SNAPSHOT_SEQ_KEY, 0))
+        for key_str, per_shot in data.items():
+            player_id, session_id_raw = key_str.split("|", 1)
+            session_id_val = session_id_raw or None
+            inner: dict = {}
+            for shot_type, acc_dict in per_shot.items():
+                inner[shot_type] = _ShotAccumulator(
+                    count=int(acc_dict.get("count", 0)),
+                    sum_confidence=float(acc_dict.get("sum_confidence", 0.0)),
+                    sum_speed_mps=float(acc_dict.get("sum_speed_mps", 0.0)),
+                )
+            restored[(player_id, session_id_val)] = inner
     _SESSION_STATS = restored
+    _SESSIONS_BY_PLAYER = {}
+    for player_id, session_id_val in restored:
+        _SESSIONS_BY_PLAYER.setdefault(player_id, set()).add(session_id_val)
+
+    # Replay swings that were journaled after the snapshot was written. Rotated
+    # journals the snapshot already covers were left behind by a crash right
+    # after the snapshot write; replaying them would count their swings twice.
+    _journal_records = 0
+    _journal_seq = covered_seq
+    journals = []
+    for seq, path in _rotated_journals():
+        _journal_seq = max(_journal_seq, seq)
+        if seq <= covered_seq:
+            path.unlink(missing_ok=True)
+        else:
+            journals.append(path)
+    journals.append(_JOURNAL_FILE)
+    for journal in journals:
+        if not journal.exists():
+            continue
+        raw = journal.read_bytes()
+        complete = raw.rfind(b"\n") + 1
+        if complete < len(raw):
+            # A torn final line from an unclean shutdown. Cut it off so the next
+            # append starts on a fresh line instead of being glued onto it.
+            with journal.open("r+b") as f:
+                f.truncate(complete)
+        for line in raw[:complete].splitlines():
+            try:
+                player_id, session_id, shot_type, confidence, speed_mps = json.loads(line)
+            except ValueError:
+                continue
+            _update_session_stats(player_id, session_id, shot_type, confidence, speed_mps)
+            _journal_records += 1
 
 
 def _save_session_stats() -> None:
-    _STATS_FILE.parent.mkdir(parents=True, exist_ok=True)
-    serializable: dict = {}
-    for (player_id, session_id), per_shot in _SESSION_STATS.items():
-        key = f"{player_id}|{session_id or ''}"
-        serializable[key] = {}
-        for shot_type, acc in per_shot.items():
-            serializable[key][shot_type] = {
-                "count": acc.count,
-                "sum_confidence": acc.sum_confidence,
-                "sum_speed_mps": acc.sum_speed_mps,
-            }
-    _STATS_FILE.write_text(json.dumps(serializable), encoding="utf-8")
+    """Write a full snapshot of _SESSION_STATS and truncate the journal.
+
+    Only copying the stats and rotating the journal happen under _STATS_LOCK,
+    so swings recorded on the event loop never wait for the file write.
+    """
+    global _journal_handle, _journal_records, _journal_seq, _compaction_scheduled
+    with _SNAPSHOT_LOCK:
+        with _STATS_LOCK:
+            _compaction_scheduled = False
+            serializable: dict = {}
+            for (player_id, session_id), per_shot in _SESSION_STATS.items():
+                key = f"{player_id}|{session_id or ''}"
+                serializable[key] = {}
+                for shot_type, acc in per_shot.items():
+                    serializable[key][shot_type] = {
+                        "count": acc.count,
+                        "sum_confidence": acc.sum_confidence,
+                        "sum_speed_mps": acc.sum_speed_mps,
+                    }
+
+            # Set the journal covered by this snapshot aside under the next
+            # sequence number; new swings start a fresh one. Journals rotated
+            # by earlier, failed snapshots are covered by this one too.
+            if _journal_handle is not None:
+                _journal_handle.close()
+                _journal_handle = None
+            _journal_seq += 1
+            if _JOURNAL_FILE.exists():
+                _JOURNAL_FILE.replace(_JOURNAL_FILE.with_name(f"{_JOURNAL_FILE.name}.{_journal_seq}"))
+            serializable[_SNAPSHOT_SEQ_KEY] = _journal_seq
+            covered_seq = _journal_seq
+            rotated_records = _journal_records
+            _journal_records = 0
 
+        try:
+            _STATS_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = _STATS_FILE.with_suffix(".json.tmp")
+            tmp_path.write_text(json.dumps(serializable), encoding="utf-8")
+            tmp_path.replace(_STATS_FILE)
+        except Exception:
+            # The rotated swings are still not in a snapshot: count them back
+            # in, at least up to the threshold, so the next swing schedules a retry
+            with _STATS_LOCK:
+                _journal_records = max(_journal_records + rotated_records, _COMPACT_EVERY)
+            raise
+        for seq, path in _rotated_journals():
+            if seq <= covered_seq:
+                path.unlink(missing_ok=True)
 
-_load_session_stats()
+
+def _append_session_journal(
+    player_id: str,
+    session_id: Optional[str],
+    shot_type: str,
+    confidence: float,
+    speed_mps: float,
+) -> bool:
+    """Record one swing as an O(1) append instead of rewriting the snapshot.
+
+    The handle stays open with default block buffering, so most calls never
+    touch the disk; it is flushed when the snapshot is compacted or on shutdown.
+    Returns True once the journal has grown enough to be compacted, and only
+    once until the compaction has run. The threshold is a lower bound because a
+    restart can replay a journal that is already past it.
+    """
+    global _journal_handle, _journal_records, _compaction_scheduled
+    if _journal_handle is None:
+        _JOURNAL_FILE.parent.mkdir(parents=True, exist_ok=True)
+        _journal_handle = _JOURNAL_FILE.open("a", encoding="utf-8")
+    record = [player_id, session_id, shot_type, float(confidence), float(speed_mps)]
+    _journal_handle.write(json.dumps(record, separators=(",", ":")) + "\n")
+    _journal_records += 1
+    if _journal_records >= _COMPACT_EVERY and not _compaction_scheduled:
+        _compaction_scheduled = True
+        return True
+    return False
 
 
 def _update_session_stats(
@@ -180,13 +346,36 @@ def _update_session_stats(
     if per_shot is None:
         per_shot = {}
         _SESSION_STATS[key] = per_shot
+        _SESSIONS_BY_PLAYER.setdefault(player_id, set()).add(session_id)
     acc = per_shot.get(shot_type)
     if acc is None:
         acc = _ShotAccumulator()
         per_shot[shot_type] = acc
-    acc.count += 1
-    acc.sum_confidence += float(confidence)
-    acc.sum_speed_mps += float(speed_mps)
+    acc.add(float(confidence), float(speed_mps))
+
+
+def _record_swing(
+    player_id: str,
+    session_id: Optional[str],
+    shot_type: str,
+    confidence: float,
+    speed_mps: float,
+) -> bool:
+    """Apply one swing to the in-memory stats and the journal atomically.
+
+    Returns True when the caller should schedule _save_session_stats.
+    """
+    with _STATS_LOCK:
+        _update_session_stats(player_id, session_id, shot_type, confidence, speed_mps)
+        return _append_session_journal(player_id, session_id, shot_type, confidence, speed_mps)
+
+
+_load_session_stats()
+
+
+@app.on_event("shutdown")
+async def _flush_session_stats() -> None:
+    _save_session_stats()
 
 @app.get("/")
 async def read_root():
@@ -204,16 +393,54 @@ async def health() -> dict:
     return {"status": "ok"}
 
 
+_SAMPLE_WIDTH = 7  # ax, ay, az, gx, gy, gz, t
+_SAMPLE_AXES = itemgetter("ax", "ay", "az", "gx", "gy", "gz")
+
+# Shortest window for which motion features (and so advanced coaching) are computed
+_MIN_FEATURE_SAMPLES = 10
+
+
+def _decode_samples_b64(samples_b64: str) -> np.ndarray:
+    """Decode packed float32 rows into a (T, 6) sensor array in one buffer copy."""
+    try:
+        raw = base64.b64decode(samples_b64, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=422, detail="samples_b64 is not valid base64.")
+    row_bytes = 4 * _SAMPLE_WIDTH
+    if len(raw) % row_bytes != 0:
+        raise HTTPException(
+            status_code=422,
+            detail=f"samples_b64 must contain whole rows of {_SAMPLE_WIDTH} float32 values.",
+        )
+    rows = np.frombuffer(raw, dtype="<f4").reshape(-1, _SAMPLE_WIDTH)
+    # Any bit pattern is a float32, so NaN/Inf arrive here unchecked
+    if not np.isfinite(rows).all():
+        raise HTTPException(status_code=422, detail="samples_b64 contains non-finite values.")
+    # Contiguous copy so the feature kernel reuses its import-time compile
+    return np.ascontiguousarray(rows[:, :6])
+
+
+def _samples_to_array(payload: SwingRequest) -> np.ndarray:
+    if payload.samples_b64 is not None:
+        return _decode_samples_b64(payload.samples_b64)
+    # Compatibility path for JSON clients sending one object per sample.
+    # fromiter fills one preallocated buffer instead of building T row lists.
+    samples = payload.samples
+    flat = itertools.chain.from_iterable(map(_SAMPLE_AXES, samples))
+    arr = np.fromiter(flat, dtype=np.float32, count=6 * len(samples)).reshape(-1, 6)
+    if not np.isfinite(arr).all():
+        raise HTTPException(status_code=422, detail="samples contain non-finite values.")
+    return arr
+
+
 @app.post("/api/swing/classify", response_model=SwingResponse)
-async def classify_swing(payload: SwingRequest) -> SwingResponse:
-    sensor_array = np.array(
-        [[s.ax, s.ay, s.az, s.gx, s.gy, s.gz] for s in payload.samples],
-        dtype=float,
-    )
+async def classify_swing(payload: SwingRequest, background: BackgroundTasks) -> SwingResponse:
+    sensor_array = _samples_to_array(payload)
     accel_norm = 0.0
     if sensor_array.size > 0:
         accel = sensor_array[:, :3]
-        accel_norm = float(np.linalg.norm(accel, axis=1).max())
+        # Only the peak magnitude is needed: take the max of squared norms, then one sqrt
+        accel_norm = math.sqrt(float(np.einsum("ij,ij->i", accel, accel).max()))
 
     classifier = get_classifier()
 
@@ -223,17 +450,18 @@ async def classify_swing(payload: SwingRequest) -> SwingResponse:
 
     if classifier.is_ready and sensor_array.size > 0:
         try:
-            shot_type, confidence = classifier.predict(sensor_array)
+            shot_type, confidence = await classifier.predict_async(sensor_array)
         except Exception:
             # Fall back to stub values if anything goes wrong
             pass
 
     accuracy_score = float(confidence)
 
-    # Extract simple motion features for advanced biomechanics feedback
+    # Extract simple motion features for advanced biomechanics feedback. Stub
+    # responses and windows too short for a follow-through skip the work.
     motion_features = (
         extract_motion_features_from_array(sensor_array)
-        if sensor_array.size > 0
+        if classifier.is_ready and sensor_array.shape[0] >= _MIN_FEATURE_SAMPLES
         else None
     )
 
@@ -255,14 +483,16 @@ async def classify_swing(payload: SwingRequest) -> SwingResponse:
         coaching_message=coaching.get("message"),
     )
 
-    _update_session_stats(
+    compaction_due = _record_swing(
         player_id=payload.player_id,
         session_id=payload.session_id,
         shot_type=shot_type,
         confidence=confidence,
         speed_mps=accel_norm,
     )
-    _save_session_stats()
+    if compaction_due:
+        # Rewrite the snapshot after the response is sent, off the event loop
+        background.add_task(_save_session_stats)
 
     # Remember the most recent result for this (player, session)
     _LAST_SWING_RESULT[(payload.player_id, payload.session_id)] = result
@@ -298,8 +528,8 @@ async def get_session_stats(player_id: str, session_id: Optional[str] = None) ->
             ShotStats(
                 shot_type=shot_type,
                 count=acc.count,
-                average_confidence=acc.sum_confidence / acc.count,
-                average_speed_mps=acc.sum_speed_mps / acc.count,
+                average_confidence=acc.average_confidence,
+                average_speed_mps=acc.average_speed_mps,
             )
         )
 
@@ -349,7 +579,7 @@ async def get_challenges(player_id: str = "practice_player", session_id: Optiona
             ch.current_accuracy = None
             ch.current_swings = 0
         else:
-            current_acc = stats.sum_confidence / stats.count
+            current_acc = stats.average_confidence
             ch.current_accuracy = float(current_acc)
             ch.current_swings = int(stats.count)
             if current_acc >= ch.target_accuracy:
@@ -367,9 +597,8 @@ async def get_challenges(player_id: str = "practice_player", session_id: Optiona
 async def get_player_history(player_id: str) -> PlayerHistoryResponse:
     sessions: List[SessionSummary] = []
 
-    for (pid, sid), per_shot in _SESSION_STATS.items():
-        if pid != player_id:
-            continue
+    for sid in _SESSIONS_BY_PLAYER.get(player_id, ()):
+        per_shot = _SESSION_STATS[(player_id, sid)]
         shots: List[ShotStats] = []
         for shot_type, acc in per_shot.items():
             if acc.count <= 0:
@@ -378,8 +607,8 @@ async def get_player_history(player_id: str) -> PlayerHistoryResponse:
                 ShotStats(
                     shot_type=shot_type,
                     count=acc.count,
-                    average_confidence=acc.sum_confidence / acc.count,
-                    average_speed_mps=acc.sum_speed_mps / acc.count,
+                    average_confidence=acc.average_confidence,
+                    average_speed_mps=acc.average_speed_mps,
                 )
             )
         shots.sort(key=lambda s: s.shot_type)
@@ -412,8 +641,8 @@ async def get_coaching_insights(
     for shot_type, acc in per_shot.items():
         if acc.count <= 0:
             continue
-        accuracy = acc.sum_confidence / acc.count
-        avg_speed = acc.sum_speed_mps / acc.count
+        accuracy = acc.average_confidence
+        avg_speed = acc.average_speed_mps
 
         if accuracy < worst_accuracy:
             worst_accuracy = accuracy
@@ -1,5 +1,8 @@
+import asyncio
+import logging
+import threading
 from pathlib import Path
-from typing import Tuple
+from typing import List, Tuple
 
 import numpy as np
 import tensorflow as tf
@@ -20,18 +23,29 @@ FIXED_LENGTH = 128
 
 MODEL_DIR = Path(__file__).resolve().parent / "models"
 MODEL_PATH = MODEL_DIR / "neurasentinel_cnn.h5"
+# int8 model produced by quantize_model.py; preferred over the .h5 when present
+TFLITE_PATH = MODEL_DIR / "neurasentinel_cnn.tflite"
 MEAN_PATH = MODEL_DIR / "scaler_mean.npy"
 SCALE_PATH = MODEL_DIR / "scaler_scale.npy"
 
+logger = logging.getLogger(__name__)
 
-def pad_or_truncate(sample: np.ndarray, length: int = FIXED_LENGTH) -> np.ndarray:
-    t, d = sample.shape
-    if t == length:
-        return sample
-    if t > length:
-        return sample[:length, :]
-    pad_width = ((0, length - t), (0, 0))
-    return np.pad(sample, pad_width=pad_width, mode="constant", constant_values=0.0)
+# Micro-batching for concurrent /api/swing/classify requests
+MAX_BATCH = 16
+
+# The CNN is tiny, so a full per-core intra-op pool only adds thread hand-offs
+# per layer and competes with the event loop. Two threads still help
+# micro-batches of 8+ swings. TF's pools can only be sized once, so this
+# must run before the model is loaded.
+INTRA_OP_THREADS = 2
+INTER_OP_THREADS = 1
+
+try:
+    tf.config.threading.set_intra_op_parallelism_threads(INTRA_OP_THREADS)
+    tf.config.threading.set_inter_op_parallelism_threads(INTER_OP_THREADS)
+except RuntimeError:
+    # TF was already initialized by an earlier import; keep its settings
+    pass
 
 
 class SwingClassifier:
@@ -39,38 +53,186 @@ class SwingClassifier:
         self.model: tf.keras.Model | None = None
         self.mean: np.ndarray | None = None
         self.scale: np.ndarray | None = None
-
-        if MODEL_PATH.exists() and MEAN_PATH.exists() and SCALE_PATH.exists():
+        self.interp: tf.lite.Interpreter | None = None
+        self._infer = None
+
+        # Reused input buffer for single-swing calls; guarded by _lock together
+        # with the TFLite interpreter, which is not thread-safe either
+        self._buf = np.zeros((1, FIXED_LENGTH, 6), dtype=np.float32)
+        self._lock = threading.Lock()
+
+        # Pending (sensor_array, future) pairs drained by the batcher task
+        self._pending: List[Tuple[np.ndarray, asyncio.Future]] = []
+        self._has_pending: asyncio.Event | None = None
+        self._batcher_task: asyncio.Task | None = None
+        self._batcher_loop: asyncio.AbstractEventLoop | None = None
+
+        if not (MEAN_PATH.exists() and SCALE_PATH.exists()):
+            return
+        if self._tflite_is_current():
+            logger.info("Serving int8 TFLite model %s", TFLITE_PATH)
+            self.interp = tf.lite.Interpreter(model_path=str(TFLITE_PATH), num_threads=1)
+            self.interp.allocate_tensors()
+            self._input_index = self.interp.get_input_details()[0]["index"]
+            self._output_index = self.interp.get_output_details()[0]["index"]
+        elif MODEL_PATH.exists():
+            logger.info("Serving Keras model %s", MODEL_PATH)
             self.model = tf.keras.models.load_model(MODEL_PATH)
-            self.mean = np.load(MEAN_PATH)
-            self.scale = np.load(SCALE_PATH)
+            self._infer = self._build_infer()
+        else:
+            return
+        self.mean = np.load(MEAN_PATH).astype(np.float32)
+        self.scale = np.load(SCALE_PATH).astype(np.float32)
+        # (x - mean) / scale == x * inv_scale + shift; avoids a per-request divide
+        self._inv_scale = np.reciprocal(self.scale)
+        self._shift = -self.mean * self._inv_scale
+
+    @staticmethod
+    def _tflite_is_current() -> bool:
+        """True if the .tflite exists and is not older than the Keras model.
+
+        A retrain rewrites the .h5 and the scaler but not the .tflite, so an
+        older .tflite would pair the previous weights with the new scaler.
+        """
+        if not TFLITE_PATH.exists():
+            return False
+        if MODEL_PATH.exists() and TFLITE_PATH.stat().st_mtime < MODEL_PATH.stat().st_mtime:
+            logger.warning(
+                "Ignoring %s: it is older than %s; re-run quantize_model.py", TFLITE_PATH, MODEL_PATH
+            )
+            return False
+        return True
+
+    def _build_infer(self):
+        """Trace the model once for (batch, FIXED_LENGTH, 6) inputs.
+
+        `model.predict` rebuilds a data iterator and callbacks on every call,
+        which dominates the cost of a single small window. A traced function
+        skips all of that. XLA is used when available.
+        """
+        model = self.model
+        signature = [tf.TensorSpec([None, FIXED_LENGTH, 6], tf.float32)]
+        dummy = tf.zeros([1, FIXED_LENGTH, 6], dtype=tf.float32)
+        for jit_compile in (True, False):
+            infer = tf.function(
+                lambda t: model(t, training=False),
+                input_signature=signature,
+                jit_compile=jit_compile,
+            )
+            try:
+                infer(dummy)  # trigger tracing/compilation at startup
+            except Exception:
+                logger.warning(
+                    "Tracing the model with jit_compile=%s failed", jit_compile, exc_info=True
+                )
+                continue
+            return infer
+        logger.warning("Could not trace the model; falling back to model.predict")
+        return None
 
     @property
     def is_ready(self) -> bool:
-        return self.model is not None and self.mean is not None and self.scale is not None
+        has_model = self.model is not None or self.interp is not None
+        return has_model and self.mean is not None and self.scale is not None
+
+    def _preprocess(self, sensor_array: np.ndarray, out: np.ndarray) -> None:
+        """Pad/truncate and normalize one swing into a (FIXED_LENGTH, 6) float32 slot.
 
-    def _preprocess(self, sensor_array: np.ndarray) -> np.ndarray:
+        Writing into `out` in place avoids the copy + allocation of `np.pad`.
+        """
         if sensor_array.ndim != 2 or sensor_array.shape[1] != 6:
             raise ValueError("Expected sensor_array shape (T, 6)")
-
-        x = pad_or_truncate(sensor_array)
         if self.mean is None or self.scale is None:
             raise RuntimeError("Scaler parameters not loaded")
-        x = (x - self.mean) / self.scale
-        return x[np.newaxis, :, :]
+
+        t = min(sensor_array.shape[0], FIXED_LENGTH)
+        out[:t] = sensor_array[:t]
+        out[t:] = 0.0
+        out *= self._inv_scale
+        out += self._shift
 
     def predict(self, sensor_array: np.ndarray) -> Tuple[str, float]:
+        return self.predict_batch([sensor_array])[0]
+
+    def predict_batch(self, sensor_arrays: List[np.ndarray]) -> List[Tuple[str, float]]:
         if not self.is_ready:
             raise RuntimeError("Model is not ready")
-        if not isinstance(sensor_array, np.ndarray):
-            sensor_array = np.array(sensor_array, dtype=float)
-
-        x = self._preprocess(sensor_array)
-        probs = self.model.predict(x, verbose=0)[0]
-        idx = int(np.argmax(probs))
-        label = CLASS_NAMES[idx]
-        confidence = float(probs[idx])
-        return label, confidence
+        arrays = [a if isinstance(a, np.ndarray) else np.asarray(a, dtype=np.float32) for a in sensor_arrays]
+        n = len(arrays)
+        with self._lock:
+            x = self._buf if n == 1 else np.empty((n, FIXED_LENGTH, 6), dtype=np.float32)
+            for i, a in enumerate(arrays):
+                self._preprocess(a, x[i])
+            probs = self._run_model(x)
+
+        results: List[Tuple[str, float]] = []
+        for row in probs:
+            idx = int(np.argmax(row))
+            results.append((CLASS_NAMES[idx], float(row[idx])))
+        return results
+
+    def _run_model(self, x: np.ndarray) -> np.ndarray:
+        n = x.shape[0]
+        if self.interp is not None:
+            # The TFLite model has a fixed batch of 1; invoking per row is cheap
+            probs = np.empty((n, len(CLASS_NAMES)), dtype=np.float32)
+            for i in range(n):
+                self.interp.set_tensor(self._input_index, x[i : i + 1])
+                self.interp.invoke()
+                probs[i] = self.interp.get_tensor(self._output_index)[0]
+        elif self._infer is not None:
+            # Pad to a power-of-two batch so XLA compiles at most a few shapes
+            padded = 1 << (n - 1).bit_length()
+            if padded > n:
+                x = np.concatenate([x, np.zeros((padded - n,) + x.shape[1:], dtype=x.dtype)], axis=0)
+            probs = self._infer(tf.constant(x)).numpy()[:n]
+        else:
+            probs = self.model.predict(x, verbose=0)
+        return probs
+
+    async def predict_async(self, sensor_array: np.ndarray) -> Tuple[str, float]:
+        """Queue one swing for the micro-batcher and wait for its prediction.
+
+        An idle batcher runs a lone swing immediately; requests that arrive
+        while a batch is in flight share the next model call of up to
+        MAX_BATCH swings, so the fixed per-call dispatch cost is paid once per
+        batch instead of once per request.
+        """
+        loop = asyncio.get_running_loop()
+        self._ensure_batcher(loop)
+        fut = loop.create_future()
+        self._pending.append((sensor_array, fut))
+        self._has_pending.set()
+        return await fut
+
+    def _ensure_batcher(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._batcher_loop is loop and self._batcher_task is not None and not self._batcher_task.done():
+            return
+        self._pending = []
+        self._has_pending = asyncio.Event()
+        self._batcher_loop = loop
+        self._batcher_task = loop.create_task(self._run_batcher())
+
+    async def _run_batcher(self) -> None:
+        while True:
+            await self._has_pending.wait()
+            # No fixed wait: whatever queued up during the previous model call
+            # forms this batch, and an idle batcher starts right away
+            batch = self._pending[:MAX_BATCH]
+            del self._pending[:MAX_BATCH]
+            if not self._pending:
+                self._has_pending.clear()
+
+            try:
+                results = await asyncio.to_thread(self.predict_batch, [x for x, _ in batch])
+            except Exception as exc:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(exc)
+                continue
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
 
 
 _classifier = SwingClassifier()
@@ -24,11 +24,14 @@ After it completes, `train_cnn.py` (configured to use `data_sets_phone`) can be
 used to train the CNN on these phone-based swings.
 """
 
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Sequence, Tuple
+from typing import Callable, Dict, List, Sequence, Tuple
 
 import numpy as np
-import pandas as pd
+from numba import njit
 
 
 CLASSES: List[str] = [
@@ -46,12 +49,16 @@ FS_TARGET: float = 100.0  # Hz
 SEGMENT_SAMPLES: int = 100  # final length per swing
 PRE_SEG_SEC: float = 0.5  # seconds before peak
 POST_SEG_SEC: float = 0.5  # seconds after peak
+WRITE_WORKERS: int = 8  # threads writing one class's segment CSVs
 
 
 ROOT = Path(__file__).resolve().parent.parent
 RAW_ROOT = ROOT / "data_sets"  # where your uploaded accel/gyro CSVs live
 OUT_ROOT = ROOT / "data_sets_phone"  # where we will write 100x6 swing CSVs
 
+SEGMENT_COLUMNS: List[str] = ["acc_x", "acc_y", "acc_z", "gyro_x", "gyro_y", "gyro_z"]
+SEGMENT_CSV_HEADER: bytes = (",".join(SEGMENT_COLUMNS) + "\n").encode("ascii")
+
 
 def load_sensor_file(path: Path) -> Tuple[np.ndarray, np.ndarray]:
     """Load a Phyphox CSV with columns like
@@ -60,33 +67,88 @@ def load_sensor_file(path: Path) -> Tuple[np.ndarray, np.ndarray]:
 
     Returns:
         t: shape (N,) time in seconds
-        xyz: shape (N, 3) for x, y, z
+        xyz: shape (N, 3) float32 for x, y, z
+    """
+
+    with open(path, "r", encoding="utf-8") as f:
+        columns = f.readline().strip().split(",")
+        if len(columns) < 4:
+            raise ValueError(f"Expected at least 4 columns in {path}, got {columns!r}")
+        arr = np.loadtxt(f, delimiter=",", usecols=(0, 1, 2, 3), ndmin=2)
+
+    # Timestamps stay float64; the sensor channels don't need more than float32
+    return arr[:, 0], arr[:, 1:4].astype(np.float32)
+
+
+def _interp_multi(
+    t_new: np.ndarray,
+    t_old: np.ndarray,
+    y: np.ndarray,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """Linearly interpolate every column of y (N, D) at t_new.
+
+    Same result as calling `np.interp(t_new, t_old, y[:, j])` for each column
+    (including clamping outside [t_old[0], t_old[-1]]). The bracketing
+    indices and weights are found once and shared by all channels.
+    t_old must be strictly increasing. If given, the result is written into
+    `out` (len(t_new), D).
     """
 
-    df = pd.read_csv(path)
-    if df.shape[1] < 4:
-        raise ValueError(f"Expected at least 4 columns in {path}, got {df.columns!r}")
+    if t_old.size == 1:
+        if out is None:
+            return np.repeat(y[:1], t_new.size, axis=0)
+        out[...] = y[:1]
+        return out
 
-    time_col = df.columns[0]
-    x_col, y_col, z_col = df.columns[1:4]
+    idx, w = _interp_weights(t_new, t_old)
+    return _apply_interp(y, idx, w.astype(y.dtype, copy=False), out)
 
-    t = df[time_col].to_numpy(dtype=float)
-    x = df[x_col].to_numpy(dtype=float)
-    y = df[y_col].to_numpy(dtype=float)
-    z = df[z_col].to_numpy(dtype=float)
-    xyz = np.stack([x, y, z], axis=1)
-    return t, xyz
 
+def _interp_weights(t_new: np.ndarray, t_old: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Left bracketing index into t_old and linear weight for each t_new."""
 
-def resample_to_grid(t: np.ndarray, xyz: np.ndarray, fs: float) -> Tuple[np.ndarray, np.ndarray]:
-    """Resample a (t, xyz) signal to a regular grid at sampling rate fs (Hz).
+    idx = np.searchsorted(t_old, t_new, side="right") - 1
+    np.clip(idx, 0, t_old.size - 2, out=idx)
+    t0 = t_old[idx]
+    w = (t_new - t0) / (t_old[idx + 1] - t0)
+    np.clip(w, 0.0, 1.0, out=w)
+    return idx, w
 
-    Uses simple linear interpolation per channel. This preserves the waveform
-    shape while giving us uniform sampling for merging accel and gyro.
+
+def _apply_interp(y: np.ndarray, idx: np.ndarray, w: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+    y0 = y[idx]
+    if out is None:
+        return y0 + w[:, np.newaxis] * (y[idx + 1] - y0)
+    np.subtract(y[idx + 1], y0, out=out)
+    out *= w[:, np.newaxis]
+    out += y0
+    return out
+
+
+@lru_cache(maxsize=256)
+def _interp_plan(t: int, target_len: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Cached (idx, w) resampling t evenly spaced samples to target_len.
+
+    Segments mostly share a handful of lengths, so to_fixed_length reuses
+    these instead of rebuilding both time axes for every segment. The arrays
+    are shared between callers and therefore read-only.
     """
 
+    old_x = np.linspace(0.0, 1.0, num=t)
+    new_x = np.linspace(0.0, 1.0, num=target_len)
+    idx, w = _interp_weights(new_x, old_x)
+    w = w.astype(np.float32)
+    idx.setflags(write=False)
+    w.setflags(write=False)
+    return idx, w
+
+
+def _clean_samples(t: np.ndarray, xyz: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sort a (t, xyz) signal by time and drop samples with repeated timestamps."""
+
     t = np.asarray(t, dtype=float)
-    xyz = np.asarray(xyz, dtype=float)
+    xyz = np.asarray(xyz, dtype=np.float32)
     if t.ndim != 1 or xyz.ndim != 2 or xyz.shape[0] != t.shape[0]:
         raise ValueError("Inconsistent shapes for t and xyz")
 
@@ -97,18 +159,7 @@ def resample_to_grid(t: np.ndarray, xyz: np.ndarray, fs: float) -> Tuple[np.ndar
 
     mask = np.ones_like(t, dtype=bool)
     mask[1:] = t[1:] > t[:-1]
-    t = t[mask]
-    xyz = xyz[mask, :]
-
-    dt = 1.0 / fs
-    t_min, t_max = float(t[0]), float(t[-1])
-    # include the last point with a small margin
-    t_grid = np.arange(t_min, t_max + 0.5 * dt, dt)
-
-    out = np.empty((t_grid.size, xyz.shape[1]), dtype=float)
-    for i in range(xyz.shape[1]):
-        out[:, i] = np.interp(t_grid, t, xyz[:, i])
-    return t_grid, out
+    return t[mask], xyz[mask, :]
 
 
 def build_common_six_axis(
@@ -123,31 +174,108 @@ def build_common_six_axis(
         data6: (T, 6) [acc_x, acc_y, acc_z, gyro_x, gyro_y, gyro_z]
     """
 
-    t_acc, acc = load_sensor_file(accel_path)
-    t_gyr, gyr = load_sensor_file(gyro_path)
-
-    t_acc_g, acc_g = resample_to_grid(t_acc, acc, fs)
-    t_gyr_g, gyr_g = resample_to_grid(t_gyr, gyr, fs)
+    t_acc, acc = _clean_samples(*load_sensor_file(accel_path))
+    t_gyr, gyr = _clean_samples(*load_sensor_file(gyro_path))
 
     # Build a common time range where both signals overlap
-    t_start = max(float(t_acc_g[0]), float(t_gyr_g[0]))
-    t_end = min(float(t_acc_g[-1]), float(t_gyr_g[-1]))
+    t_start = max(float(t_acc[0]), float(t_gyr[0]))
+    t_end = min(float(t_acc[-1]), float(t_gyr[-1]))
     if t_end <= t_start:
         raise ValueError(f"No overlapping time range between {accel_path} and {gyro_path}")
 
     dt = 1.0 / fs
+    # include the last point with a small margin
     t_grid = np.arange(t_start, t_end + 0.5 * dt, dt)
 
-    acc_common = np.empty((t_grid.size, 3), dtype=float)
-    gyr_common = np.empty((t_grid.size, 3), dtype=float)
-    for i in range(3):
-        acc_common[:, i] = np.interp(t_grid, t_acc_g, acc_g[:, i])
-        gyr_common[:, i] = np.interp(t_grid, t_gyr_g, gyr_g[:, i])
-
-    data6 = np.concatenate([acc_common, gyr_common], axis=1)
+    # Interpolate the raw samples straight onto the common grid, each sensor
+    # into its half of the output
+    data6 = np.empty((t_grid.size, 6), dtype=np.float32)
+    _interp_multi(t_grid, t_acc, acc, out=data6[:, :3])
+    _interp_multi(t_grid, t_gyr, gyr, out=data6[:, 3:])
     return t_grid, data6
 
 
+def acceleration_magnitude(data6: np.ndarray) -> np.ndarray:
+    """Per-sample |acc| of a (T, 6) array, used for swing peak detection.
+
+    `einsum` squares and sums the three accel columns in one pass, without the
+    intermediate (T, 3) squared array that `np.linalg.norm` allocates.
+    """
+
+    acc = data6[:, :3]
+    return np.sqrt(np.einsum("ij,ij->i", acc, acc))
+
+
+def _moving_average(signal: np.ndarray, window: int) -> np.ndarray:
+    """Boxcar average equal to `np.convolve(signal, ones(window) / window, "same")`.
+
+    Window sums come from differences of a running sum, so the cost does not
+    grow with `window`. Samples beyond either end count as zero, as in the
+    zero-padded convolution.
+    """
+
+    n = signal.size
+    c = np.empty(n + 1)
+    c[0] = 0.0
+    np.cumsum(signal, out=c[1:])
+
+    # Output i is (c[min(k, n)] - c[max(k - window, 0)]) / window with
+    # k = i + s + 1: the full convolution sums signal[k - window : k], and
+    # "same" keeps max(n, window) outputs centred on the longer input. Both
+    # index ranges are contiguous apart from their clamped ends, so plain
+    # slices build the result in one buffer without index arrays.
+    size = max(n, window)
+    s = (min(n, window) - 1) // 2
+    m = min(size, n - s)
+    out = np.empty(size)
+    out[:m] = c[s + 1 : s + 1 + m]
+    out[m:] = c[n]
+    q = min(size, window - s)
+    out[q:] -= c[1 : 1 + size - q]
+    out /= window
+    return out
+
+
+@njit(cache=True)
+def _detect_peaks(smooth: np.ndarray, thresh_factor: float, min_dist: int) -> np.ndarray:
+    """Local maxima of `smooth` above mean + thresh_factor * std, at least
+    `min_dist` apart.
+
+    Mean and std come from a single Welford pass. The detection sweep then
+    either keeps each local maximum above threshold as a new peak or, when
+    it falls within `min_dist` of the last kept peak, replaces that peak if
+    it is stronger.
+    """
+
+    n = smooth.size
+    mean = 0.0
+    m2 = 0.0
+    for i in range(n):
+        v = smooth[i]
+        delta = v - mean
+        mean += delta / (i + 1)
+        m2 += delta * (v - mean)
+    std = np.sqrt(m2 / n)
+    if std == 0.0:
+        std = 1.0
+    thresh = mean + thresh_factor * std
+
+    peaks = np.empty(n, dtype=np.int64)
+    count = 0
+    last_idx = -min_dist
+    for i in range(1, n - 1):
+        v = smooth[i]
+        if v > thresh and v >= smooth[i - 1] and v >= smooth[i + 1]:
+            if i - last_idx >= min_dist:
+                peaks[count] = i
+                count += 1
+                last_idx = i
+            elif v > smooth[last_idx]:
+                peaks[count - 1] = i
+                last_idx = i
+    return peaks[:count]
+
+
 def smooth_and_detect_peaks(
     signal: np.ndarray,
     fs: float,
@@ -164,6 +292,8 @@ def smooth_and_detect_peaks(
     examiners can reason about it.
     """
 
+    # float64 on purpose: the running sum in _moving_average would lose
+    # precision over a long recording in float32
     signal = np.asarray(signal, dtype=float)
     n = signal.size
     if n < 3:
@@ -171,40 +301,12 @@ def smooth_and_detect_peaks(
 
     # Moving average smoothing (~50 ms window)
     window = max(3, int(0.05 * fs))
-    if window > 1:
-        kernel = np.ones(window, dtype=float) / float(window)
-        smooth = np.convolve(signal, kernel, mode="same")
-    else:
-        smooth = signal
-
-    mean = float(smooth.mean())
-    std = float(smooth.std()) or 1.0
-    thresh = mean + thresh_factor * std
-
-    # Local maxima above threshold
-    candidates: List[int] = []
-    for i in range(1, n - 1):
-        if smooth[i] > thresh and smooth[i] >= smooth[i - 1] and smooth[i] >= smooth[i + 1]:
-            candidates.append(i)
-
-    if not candidates:
-        return []
+    smooth = _moving_average(signal, window)
 
-    # Enforce minimum spacing between peaks
+    # Local maxima above mean + thresh_factor * std, with a minimum spacing
+    # between peaks
     min_dist = int(min_distance_sec * fs)
-    peaks: List[int] = []
-    last_idx = -min_dist
-    for idx in candidates:
-        if idx - last_idx >= min_dist:
-            peaks.append(idx)
-            last_idx = idx
-        else:
-            # If this candidate is stronger than the last kept one, replace it
-            if smooth[idx] > smooth[last_idx]:
-                peaks[-1] = idx
-                last_idx = idx
-
-    return peaks
+    return _detect_peaks(smooth, thresh_factor, min_dist).tolist()
 
 
 def segment_around_peaks(
@@ -220,7 +322,7 @@ def segment_around_peaks(
     SEGMENT_SAMPLES afterwards.
     """
 
-    data6 = np.asarray(data6, dtype=float)
+    data6 = np.asarray(data6, dtype=np.float32)
     n, d = data6.shape
     assert d == 6, "Expected 6 channels in data6"
 
@@ -246,27 +348,39 @@ def to_fixed_length(seg: np.ndarray, target_len: int) -> np.ndarray:
     - If T < target_len, upsample via interpolation.
     """
 
-    seg = np.asarray(seg, dtype=float)
+    seg = np.asarray(seg, dtype=np.float32)
     t, d = seg.shape
     if d != 6:
         raise ValueError(f"Expected 6 channels, got {d}")
 
     if t == target_len:
         return seg
+    if t == 1:
+        return np.repeat(seg, target_len, axis=0)
 
     # Interpolate over a normalized time axis [0, 1]
-    old_x = np.linspace(0.0, 1.0, num=t)
-    new_x = np.linspace(0.0, 1.0, num=target_len)
-    out = np.empty((target_len, d), dtype=float)
-    for j in range(d):
-        out[:, j] = np.interp(new_x, old_x, seg[:, j])
-    return out
+    idx, w = _interp_plan(t, target_len)
+    return _apply_interp(seg, idx, w)
+
+
+def write_segment_csv(out_path: Path, fixed: np.ndarray) -> None:
+    """Write one (SEGMENT_SAMPLES, 6) swing as a plain numeric CSV.
 
+    The schema is fixed and purely numeric, so writing the header and calling
+    `np.savetxt` gives the same columns as `DataFrame.to_csv` without building
+    a DataFrame. Values keep 6 significant digits, which is finer than the
+    resolution of phone IMU sensors.
+    """
+
+    with open(out_path, "wb") as f:
+        f.write(SEGMENT_CSV_HEADER)
+        np.savetxt(f, fixed, fmt="%.6g", delimiter=",")
 
-def process_class(class_name: str) -> int:
+
+def process_class(class_name: str, log: Callable[[str], None] = print) -> int:
     """Process one stroke class.
 
-    Returns the number of segments written.
+    Progress messages go through `log`. Returns the number of segments written.
     """
 
     src_dir = RAW_ROOT / class_name
@@ -278,56 +392,70 @@ def process_class(class_name: str) -> int:
     gyro_candidates = list(src_dir.glob("*gyro*.csv"))
 
     if not accel_candidates:
-        print(f"[WARN] No accelerometer CSV found for class {class_name} in {src_dir}")
+        log(f"[WARN] No accelerometer CSV found for class {class_name} in {src_dir}")
         return 0
     if not gyro_candidates:
-        print(f"[WARN] No gyro CSV found for class {class_name} in {src_dir}")
+        log(f"[WARN] No gyro CSV found for class {class_name} in {src_dir}")
         return 0
 
     accel_path = accel_candidates[0]
     gyro_path = gyro_candidates[0]
 
-    print(f"[INFO] Processing {class_name}:\n  accel={accel_path.name}\n  gyro={gyro_path.name}")
+    log(f"[INFO] Processing {class_name}:\n  accel={accel_path.name}\n  gyro={gyro_path.name}")
 
     t_grid, data6 = build_common_six_axis(accel_path, gyro_path, FS_TARGET)
 
     # Use acceleration magnitude to detect swing peaks
-    acc = data6[:, :3]
-    mag = np.linalg.norm(acc, axis=1)
+    mag = acceleration_magnitude(data6)
 
     peaks = smooth_and_detect_peaks(mag, FS_TARGET, thresh_factor=1.0, min_distance_sec=0.3)
     if not peaks:
-        print(f"[WARN] No peaks detected for class {class_name}. No segments will be created.")
+        log(f"[WARN] No peaks detected for class {class_name}. No segments will be created.")
         return 0
 
     segments = segment_around_peaks(data6, peaks, FS_TARGET, PRE_SEG_SEC, POST_SEG_SEC)
 
-    count = 0
-    for idx, seg in enumerate(segments, start=1):
-        fixed = to_fixed_length(seg, SEGMENT_SAMPLES)
-        df_out = pd.DataFrame(
-            fixed,
-            columns=["acc_x", "acc_y", "acc_z", "gyro_x", "gyro_y", "gyro_z"],
-        )
-        out_path = out_dir / f"{class_name}_{idx:03d}.csv"
-        df_out.to_csv(out_path, index=False)
-        count += 1
-
-    print(f"[INFO] {class_name}: wrote {count} segments to {out_dir}")
+    fixed_all = np.empty((len(segments), SEGMENT_SAMPLES, 6), dtype=np.float32)
+    for i, seg in enumerate(segments):
+        fixed_all[i] = to_fixed_length(seg, SEGMENT_SAMPLES)
+    out_paths = [out_dir / f"{class_name}_{idx:03d}.csv" for idx in range(1, len(segments) + 1)]
+
+    # Writing many small files is I/O bound; overlap it on a few threads
+    with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as ex:
+        list(ex.map(write_segment_csv, out_paths, fixed_all))
+    count = len(out_paths)
+
+    log(f"[INFO] {class_name}: wrote {count} segments to {out_dir}")
     return count
 
 
+def _process_class_logged(class_name: str) -> Tuple[int, List[str]]:
+    """Worker entry point: run process_class and collect its messages.
+
+    Messages are returned rather than printed so that classes processed in
+    parallel don't interleave their output.
+    """
+
+    lines: List[str] = []
+    try:
+        n = process_class(class_name, log=lines.append)
+    except Exception as exc:  # pragma: no cover - defensive
+        lines.append(f"[ERROR] Failed to process class {class_name}: {exc}")
+        n = 0
+    return n, lines
+
+
 def main() -> None:
     OUT_ROOT.mkdir(parents=True, exist_ok=True)
 
+    # Classes share no state, so each one runs in its own process
     summary: Dict[str, int] = {}
-    for class_name in CLASSES:
-        try:
-            n = process_class(class_name)
-        except Exception as exc:  # pragma: no cover - defensive
-            print(f"[ERROR] Failed to process class {class_name}: {exc}")
-            n = 0
-        summary[class_name] = n
+    workers = min(len(CLASSES), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for class_name, (n, lines) in zip(CLASSES, ex.map(_process_class_logged, CLASSES)):
+            for line in lines:
+                print(line)
+            summary[class_name] = n
 
     print("\n=== Summary (segments per class) ===")
     for cls, n in summary.items():
@@ -0,0 +1,78 @@
+"""Convert the trained Keras CNN into an int8-quantized TFLite model.
+
+Post-training quantization uses real swings from `../data_sets_phone/` as the
+representative dataset, normalized with the same scaler as inference.
+Weights and activations are stored as int8. Input and output tensors stay
+float32, so `ml_model.SwingClassifier` feeds the model exactly as before.
+
+Run this script from the backend folder after `train_cnn.py`:
+
+    python quantize_model.py
+
+When `models/neurasentinel_cnn.tflite` exists and is not older than the
+`.h5` model, the backend loads it instead of the `.h5` model.
+"""
+
+from pathlib import Path
+from typing import Iterator, List
+
+import numpy as np
+import tensorflow as tf
+
+from train_cnn import CLASS_NAMES, FIXED_LENGTH, load_class_samples, pad_or_truncate
+
+
+MODEL_DIR = Path(__file__).resolve().parent / "models"
+KERAS_PATH = MODEL_DIR / "neurasentinel_cnn.h5"
+TFLITE_PATH = MODEL_DIR / "neurasentinel_cnn.tflite"
+MEAN_PATH = MODEL_DIR / "scaler_mean.npy"
+SCALE_PATH = MODEL_DIR / "scaler_scale.npy"
+
+N_REPRESENTATIVE = 100  # calibration windows, spread evenly across classes
+
+
+def representative_windows(mean: np.ndarray, scale: np.ndarray) -> List[np.ndarray]:
+    """Pick normalized (1, FIXED_LENGTH, 6) windows round-robin over classes."""
+
+    per_class = [load_class_samples(name) for name in CLASS_NAMES]
+    windows: List[np.ndarray] = []
+    i = 0
+    while len(windows) < N_REPRESENTATIVE and any(i < len(s) for s in per_class):
+        for samples in per_class:
+            if i < len(samples) and len(windows) < N_REPRESENTATIVE:
+                x = (pad_or_truncate(samples[i], FIXED_LENGTH) - mean) / scale
+                windows.append(x[np.newaxis, :, :].astype(np.float32))
+        i += 1
+    return windows
+
+
+def main() -> None:
+    if not (KERAS_PATH.exists() and MEAN_PATH.exists() and SCALE_PATH.exists()):
+        print(f"[ERROR] Trained model or scaler not found in {MODEL_DIR}. Run train_cnn.py first.")
+        return
+
+    model = tf.keras.models.load_model(KERAS_PATH)
+    mean = np.load(MEAN_PATH)
+    scale = np.load(SCALE_PATH)
+    windows = representative_windows(mean, scale)
+    print(f"[INFO] Calibrating with {len(windows)} representative swings")
+
+    def representative_dataset() -> Iterator[List[np.ndarray]]:
+        for x in windows:
+            yield [x]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    tflite_model = converter.convert()
+
+    TFLITE_PATH.write_bytes(tflite_model)
+    print(
+        f"Saved int8 model to {TFLITE_PATH} "
+        f"({len(tflite_model) / 1024:.1f} KiB, Keras .h5 is {KERAS_PATH.stat().st_size / 1024:.1f} KiB)"
+    )
+
+
+if __name__ == "__main__":
+    main()
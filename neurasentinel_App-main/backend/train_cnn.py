@@ -1,19 +1,21 @@
+import hashlib
 import os
 import random
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Tuple
 
 import numpy as np
-import pandas as pd
 from sklearn.metrics import classification_report, confusion_matrix
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
 from sklearn.utils.class_weight import compute_class_weight
 import tensorflow as tf
 from tensorflow.keras import layers, models
 
 
 DATA_DIR = Path(__file__).resolve().parent.parent / "data_sets_phone"
+# Built datasets, keyed by their inputs (see dataset_cache_key)
+CACHE_DIR = Path(__file__).resolve().parent / "cache"
 CLASS_NAMES = [
     "Forehand",
     "Backhand",
@@ -25,6 +27,7 @@ CLASS_NAMES = [
     "Chop",
 ]
 N_CLASSES = len(CLASS_NAMES)
+SENSOR_COLUMNS = ["acc_x", "acc_y", "acc_z", "gyro_x", "gyro_y", "gyro_z"]
 TARGET_PER_CLASS = 150
 TEST_TARGET_PER_CLASS = 63  # 63 * 8 = 504 (> 500)
 VAL_TARGET_PER_CLASS = 27
@@ -32,6 +35,8 @@ TRAIN_TARGET_PER_CLASS = TARGET_PER_CLASS - TEST_TARGET_PER_CLASS - VAL_TARGET_P
 
 FIXED_LENGTH = 128  # time steps per swing after padding/truncation
 RANDOM_STATE = 42
+LOAD_WORKERS = 8  # threads reading a class's CSVs concurrently
+BATCH_SIZE = 32
 
 # Deterministic seeding for reproducible training runs
 SEED = RANDOM_STATE
@@ -39,22 +44,29 @@ os.environ["PYTHONHASHSEED"] = str(SEED)
 random.seed(SEED)
 np.random.seed(SEED)
 tf.random.set_seed(SEED)
+# Generator used by augment_batch; PCG64 and draws straight into float32
+_RNG = np.random.default_rng(SEED)
+
+
+def _read_sample_csv(csv_path: Path) -> np.ndarray:
+    with open(csv_path, "r", encoding="utf-8") as f:
+        columns = f.readline().strip().split(",")
+        # Expecting columns: acc_x, acc_y, acc_z, gyro_x, gyro_y, gyro_z
+        if not set(SENSOR_COLUMNS).issubset(columns):
+            raise ValueError(f"Unexpected columns in {csv_path}: {columns}")
+        usecols = [columns.index(c) for c in SENSOR_COLUMNS]
+        return np.loadtxt(f, delimiter=",", usecols=usecols, ndmin=2, dtype=np.float32)
 
 
 def load_class_samples(class_name: str) -> List[np.ndarray]:
     class_dir = DATA_DIR / class_name
-    samples: List[np.ndarray] = []
     if not class_dir.exists():
         raise FileNotFoundError(f"Directory not found for class {class_name}: {class_dir}")
 
-    for csv_path in sorted(class_dir.glob("*.csv")):
-        df = pd.read_csv(csv_path)
-        # Expecting columns: acc_x, acc_y, acc_z, gyro_x, gyro_y, gyro_z
-        if not {"acc_x", "acc_y", "acc_z", "gyro_x", "gyro_y", "gyro_z"}.issubset(df.columns):
-            raise ValueError(f"Unexpected columns in {csv_path}: {df.columns}")
-        arr = df[["acc_x", "acc_y", "acc_z", "gyro_x", "gyro_y", "gyro_z"]].to_numpy(dtype=float)
-        samples.append(arr)
-    return samples
+    # Overlap file reads; map keeps the sorted file order
+    csv_paths = sorted(class_dir.glob("*.csv"))
+    with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as ex:
+        return list(ex.map(_read_sample_csv, csv_paths))
 
 
 def pad_or_truncate(sample: np.ndarray, length: int = FIXED_LENGTH) -> np.ndarray:
@@ -68,44 +80,53 @@ def pad_or_truncate(sample: np.ndarray, length: int = FIXED_LENGTH) -> np.ndarra
     return np.pad(sample, pad_width=pad_width, mode="constant", constant_values=0.0)
 
 
-def augment_sample(sample: np.ndarray) -> np.ndarray:
+def augment_batch(X_base: np.ndarray, needed: int) -> np.ndarray:
     """IMU augmentation: small noise + channel gain + time scaling.
 
-    This keeps label semantics but increases robustness while avoiding
-    overly aggressive distortions.
+    Produces `needed` augmented copies of the (N, FIXED_LENGTH, 6) windows in
+    X_base, taken round-robin. This keeps label semantics but increases
+    robustness while avoiding overly aggressive distortions.
     """
 
-    # Additive Gaussian noise (light)
-    noise = np.random.normal(loc=0.0, scale=0.02, size=sample.shape)
-    aug = sample + noise
-
-    # Small per-channel gain
-    gains = np.random.uniform(0.97, 1.03, size=(sample.shape[1],))
-    aug = aug * gains[np.newaxis, :]
-
-    # Slight time scaling by interpolation (stretch/compress)
-    t, d = aug.shape
-    scale = np.random.uniform(0.92, 1.08)
-    new_t = int(t * scale)
-    if new_t < 2:
-        new_t = 2
-    orig_idx = np.linspace(0, t - 1, num=t)
-    new_idx = np.linspace(0, t - 1, num=new_t)
-    aug_scaled = np.zeros((new_t, d), dtype=float)
-    for j in range(d):
-        aug_scaled[:, j] = np.interp(new_idx, orig_idx, aug[:, j])
-
-    return pad_or_truncate(aug_scaled, FIXED_LENGTH)
-
-
-def prepare_split_for_class(samples: List[np.ndarray], class_index: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
-    """Split originals into train/val/test, then augment within each split to reach
-    TRAIN_TARGET_PER_CLASS, VAL_TARGET_PER_CLASS, TEST_TARGET_PER_CLASS.
+    n_current, t, d = X_base.shape
+    base = X_base[np.arange(needed) % n_current]
+
+    # Additive Gaussian noise (light) and a small per-channel gain
+    aug = _RNG.standard_normal(base.shape, dtype=np.float32)
+    aug *= 0.02
+    aug += base
+    gains = _RNG.random((needed, 1, d), dtype=np.float32)
+    gains *= 0.06
+    gains += 0.97
+    aug *= gains
+
+    # Slight time scaling by interpolation (stretch/compress), then
+    # pad/truncate back to FIXED_LENGTH. Samples sharing a stretched length
+    # share one interpolation plan.
+    new_lens = np.maximum((t * _RNG.uniform(0.92, 1.08, size=needed)).astype(int), 2)
+    out = np.zeros((needed, FIXED_LENGTH, d), dtype=np.float32)
+    for new_t in np.unique(new_lens):
+        rows = np.flatnonzero(new_lens == new_t)
+        keep = min(int(new_t), FIXED_LENGTH)
+        pos = np.linspace(0, t - 1, num=new_t)[:keep]
+        i0 = np.minimum(pos.astype(np.intp), t - 2)
+        w = (pos - i0).astype(np.float32)[np.newaxis, :, np.newaxis]
+        group = aug[rows]
+        y0 = group[:, i0]
+        out[rows, :keep] = y0 + w * (group[:, i0 + 1] - y0)
+
+    return out
+
+
+def split_class_samples(samples: List[np.ndarray], class_index: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pad/truncate the originals of one class and split them into train/val/test.
+
+    Augmentation happens later in `build_dataset`, straight into the final arrays.
     """
     # First pad/truncate originals
     processed = [pad_or_truncate(s) for s in samples]
     X = np.stack(processed, axis=0)
-    y = np.full(shape=(X.shape[0],), fill_value=class_index, dtype=int)
+    y = np.full(shape=(X.shape[0],), fill_value=class_index, dtype=np.int32)
 
     # Initial split: train+val vs test
     X_train_val, X_test, y_train_val, y_test = train_test_split(
@@ -125,87 +146,123 @@ def prepare_split_for_class(samples: List[np.ndarray], class_index: int) -> Tupl
         random_state=RANDOM_STATE,
     )
 
-    def augment_to_target(X_split: np.ndarray, y_split: np.ndarray, target: int) -> Tuple[np.ndarray, np.ndarray]:
-        n_current = X_split.shape[0]
-        if n_current >= target:
-            return X_split, y_split
-        needed = target - n_current
-        aug_list: List[np.ndarray] = []
-        for i in range(needed):
-            base = X_split[i % n_current]
-            aug_list.append(augment_sample(base))
-        X_aug = np.concatenate([X_split, np.stack(aug_list, axis=0)], axis=0)
-        y_aug = np.full(shape=(X_aug.shape[0],), fill_value=class_index, dtype=int)
-        return X_aug, y_aug
+    return X_train, X_val, X_test
 
-    X_train_aug, y_train_aug = augment_to_target(X_train, y_train, TRAIN_TARGET_PER_CLASS)
-    X_val_aug, y_val_aug = augment_to_target(X_val, y_val, VAL_TARGET_PER_CLASS)
-    X_test_aug, y_test_aug = augment_to_target(X_test, y_test, TEST_TARGET_PER_CLASS)
 
-    return X_train_aug, y_train_aug, X_val_aug, y_val_aug, X_test_aug, y_test_aug
+def augment_into(X_split: np.ndarray, X_out: np.ndarray) -> None:
+    """Fill X_out with the originals in X_split followed by augmented copies."""
+    n_current = X_split.shape[0]
+    X_out[:n_current] = X_split
+    if X_out.shape[0] > n_current:
+        X_out[n_current:] = augment_batch(X_split, X_out.shape[0] - n_current)
 
 
 def build_dataset() -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
-    X_train_list: List[np.ndarray] = []
-    y_train_list: List[np.ndarray] = []
-    X_val_list: List[np.ndarray] = []
-    y_val_list: List[np.ndarray] = []
-    X_test_list: List[np.ndarray] = []
-    y_test_list: List[np.ndarray] = []
-
-    for class_index, class_name in enumerate(CLASS_NAMES):
-        samples = load_class_samples(class_name)
-        (
-            X_tr,
-            y_tr,
-            X_va,
-            y_va,
-            X_te,
-            y_te,
-        ) = prepare_split_for_class(samples, class_index)
-        X_train_list.append(X_tr)
-        y_train_list.append(y_tr)
-        X_val_list.append(X_va)
-        y_val_list.append(y_va)
-        X_test_list.append(X_te)
-        y_test_list.append(y_te)
-
-    X_train = np.concatenate(X_train_list, axis=0)
-    y_train = np.concatenate(y_train_list, axis=0)
-    X_val = np.concatenate(X_val_list, axis=0)
-    y_val = np.concatenate(y_val_list, axis=0)
-    X_test = np.concatenate(X_test_list, axis=0)
-    y_test = np.concatenate(y_test_list, axis=0)
-
+    splits = [split_class_samples(load_class_samples(name), i) for i, name in enumerate(CLASS_NAMES)]
+    targets = (TRAIN_TARGET_PER_CLASS, VAL_TARGET_PER_CLASS, TEST_TARGET_PER_CLASS)
+
+    # Each split is augmented up to its target (classes already above it are
+    # kept whole), so the final sizes are known before any augmentation runs
+    # and the output arrays can be allocated once
+    sizes = [[max(X_split.shape[0], target) for X_split, target in zip(class_splits, targets)] for class_splits in splits]
+    outputs = []
+    for part in range(3):
+        total = sum(class_sizes[part] for class_sizes in sizes)
+        outputs.append((np.empty((total, FIXED_LENGTH, 6), dtype=np.float32), np.empty(total, dtype=np.int32)))
+
+    offsets = [0, 0, 0]
+    for class_index, (class_splits, class_sizes) in enumerate(zip(splits, sizes)):
+        for part, (X_split, size) in enumerate(zip(class_splits, class_sizes)):
+            X_out, y_out = outputs[part]
+            start = offsets[part]
+            augment_into(X_split, X_out[start : start + size])
+            y_out[start : start + size] = class_index
+            offsets[part] += size
+
+    (X_train, y_train), (X_val, y_val), (X_test, y_test) = outputs
     return X_train, y_train, X_val, y_val, X_test, y_test
 
 
+DATASET_KEYS = ("X_train", "y_train", "X_val", "y_val", "X_test", "y_test")
+
+
+def dataset_cache_key() -> str:
+    """Hash of everything build_dataset depends on except the code itself.
+
+    Covers the class list, window length, split targets, seed and the
+    name/size/mtime of every sample CSV. Delete `cache/` after changing the
+    split or augmentation code.
+    """
+    files = []
+    for class_name in CLASS_NAMES:
+        for csv_path in sorted((DATA_DIR / class_name).glob("*.csv")):
+            st = csv_path.stat()
+            files.append((f"{class_name}/{csv_path.name}", st.st_size, st.st_mtime_ns))
+    material = (
+        CLASS_NAMES,
+        FIXED_LENGTH,
+        (TRAIN_TARGET_PER_CLASS, VAL_TARGET_PER_CLASS, TEST_TARGET_PER_CLASS),
+        SEED,
+        files,
+    )
+    return hashlib.sha1(repr(material).encode("utf-8")).hexdigest()
+
+
+def load_or_build_dataset() -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Return the cached dataset for the current inputs, building it on a miss."""
+    cache_path = CACHE_DIR / f"dataset_{dataset_cache_key()}.npz"
+    if cache_path.exists():
+        print(f"Loading cached dataset from {cache_path}")
+        with np.load(cache_path) as data:
+            return tuple(data[k] for k in DATASET_KEYS)
+
+    print("Building dataset...")
+    arrays = build_dataset()
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **dict(zip(DATASET_KEYS, arrays)))
+    tmp_path.replace(cache_path)
+    return arrays
+
+
 def normalize_datasets(
     X_train: np.ndarray,
     X_val: np.ndarray,
     X_test: np.ndarray,
 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
-    # Flatten over time to fit a scaler per channel
-    n_train, t, d = X_train.shape
-    scaler = StandardScaler()
-    X_train_flat = X_train.reshape(-1, d)
-    scaler.fit(X_train_flat)
+    X_train = X_train.astype(np.float32, copy=False)
+    # Per-channel statistics over samples and time, same as a StandardScaler
+    # fit on the (N * T, 6) flattening; accumulated in float64
+    mean = X_train.mean(axis=(0, 1), dtype=np.float64)
+    scale = X_train.std(axis=(0, 1), dtype=np.float64)
+    scale[scale == 0.0] = 1.0
+
+    mean32 = mean.astype(np.float32)
+    scale32 = scale.astype(np.float32)
 
     def transform(X: np.ndarray) -> np.ndarray:
-        n, t_local, d_local = X.shape
-        X_flat = X.reshape(-1, d_local)
-        X_scaled = scaler.transform(X_flat)
-        return X_scaled.reshape(n, t_local, d_local)
+        return (X - mean32) / scale32
 
     X_train_n = transform(X_train)
     X_val_n = transform(X_val)
     X_test_n = transform(X_test)
 
-    mean = scaler.mean_
-    scale = scaler.scale_
     return X_train_n, X_val_n, X_test_n, mean, scale
 
 
+def make_tf_dataset(X: np.ndarray, y: np.ndarray, shuffle: bool = False) -> tf.data.Dataset:
+    """Batched, prefetched tf.data pipeline over in-memory arrays.
+
+    Prefetching prepares the next batch while the current step runs, and
+    shuffling happens inside tf.data instead of Keras copying the arrays.
+    """
+    ds = tf.data.Dataset.from_tensor_slices((X.astype(np.float32, copy=False), y))
+    if shuffle:
+        ds = ds.shuffle(len(y), seed=SEED, reshuffle_each_iteration=True)
+    return ds.batch(BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+
+
 def build_model(input_shape: Tuple[int, int]) -> tf.keras.Model:
     model = models.Sequential()
     model.add(layers.Input(shape=input_shape))
@@ -223,25 +280,48 @@ def build_model(input_shape: Tuple[int, int]) -> tf.keras.Model:
 
     model.add(layers.Dense(128, activation="relu"))
     model.add(layers.Dropout(0.5))
-    model.add(layers.Dense(N_CLASSES, activation="softmax"))
+    # Softmax stays float32 under mixed precision for numerical stability
+    model.add(layers.Dense(N_CLASSES, activation="softmax", dtype="float32"))
 
     model.compile(
         optimizer=tf.keras.optimizers.Adam(learning_rate=1e-3),
         loss="sparse_categorical_crossentropy",
         metrics=["accuracy"],
+        # XLA fuses the Conv1D/BatchNorm/ReLU chains for the fixed (128, 6) input
+        jit_compile=True,
     )
     return model
 
 
+def use_mixed_precision() -> bool:
+    """Train in float16 with float32 master weights when a GPU is available.
+
+    CPUs have no fast float16 path, so there the default float32 policy is kept.
+    Keras wraps the optimizer in a LossScaleOptimizer automatically.
+    """
+    if not tf.config.list_physical_devices("GPU"):
+        return False
+    tf.keras.mixed_precision.set_global_policy("mixed_float16")
+    return True
+
+
+def to_float32_model(model: tf.keras.Model) -> tf.keras.Model:
+    """Copy trained weights into a float32 model for CPU serving and TFLite export."""
+    tf.keras.mixed_precision.set_global_policy("float32")
+    clone = build_model(model.input_shape[1:])
+    clone.set_weights(model.get_weights())
+    return clone
+
+
 def main() -> None:
-    print("Building dataset...")
-    X_train, y_train, X_val, y_val, X_test, y_test = build_dataset()
+    X_train, y_train, X_val, y_val, X_test, y_test = load_or_build_dataset()
     print(
         f"Train: {X_train.shape}, Val: {X_val.shape}, Test: {X_test.shape} (should be > 500 test samples: {X_test.shape[0]})"
     )
 
     X_train_n, X_val_n, X_test_n, mean, scale = normalize_datasets(X_train, X_val, X_test)
 
+    mixed_precision = use_mixed_precision()
     input_shape = (FIXED_LENGTH, X_train_n.shape[2])
     model = build_model(input_shape)
     model.summary()
@@ -276,12 +356,13 @@ def main() -> None:
         verbose=1,
     )
 
+    train_ds = make_tf_dataset(X_train_n, y_train, shuffle=True)
+    val_ds = make_tf_dataset(X_val_n, y_val)
+
     model.fit(
-        X_train_n,
-        y_train,
-        validation_data=(X_val_n, y_val),
+        train_ds,
+        validation_data=val_ds,
         epochs=100,
-        batch_size=32,
         callbacks=[checkpoint_cb, reduce_lr_cb, earlystop_cb],
         class_weight=class_weight_dict,
         verbose=1,
@@ -306,7 +387,16 @@ def main() -> None:
 
     # Save model, normalization stats, and metrics
     model_path = out_dir / "neurasentinel_cnn.h5"
+    if mixed_precision:
+        model = to_float32_model(model)
+        # The checkpoint was written mid-training with float16 compute layers
+        best_path = out_dir / "neurasentinel_cnn_best.h5"
+        if best_path.exists():
+            best = tf.keras.models.load_model(best_path, compile=False)
+            to_float32_model(best).save(best_path)
     model.save(model_path)
+    # A quantized model from an earlier run no longer matches these weights
+    (out_dir / "neurasentinel_cnn.tflite").unlink(missing_ok=True)
     np.save(out_dir / "scaler_mean.npy", mean)
     np.save(out_dir / "scaler_scale.npy", scale)
 